@@ -1,11 +1,17 @@
 # !/usr/bin/env python3
 # coding=utf-8
 import logging
+import mmap
+import os
 import re
 import struct
 import r2pipe
 import sys
+import tempfile
 import time
+from array import array
+from collections import defaultdict
+from operator import itemgetter, sub
 
 default_check_count = 100
 
@@ -53,6 +59,44 @@ vx_6_sym_types = [
 
 need_create_function = [0x04, 0x05]
 
+# r2 commands of loading symbols as bytes, run as one r2 script
+pending_r2_commands = []
+
+
+# struct format of symbol entry without endian prefix: symbol name point, symbol value point, symbol type
+vx_5_symbol_format = '4xII2xBx'
+vx_6_symbol_format = '4xII6xBx'
+
+# lookup table of valid symbol types, indexed by symbol type byte
+vx_5_sym_type_table = bytes(sym_type in vx_5_sym_types for sym_type in range(256))
+vx_6_sym_type_table = bytes(sym_type in vx_6_sym_types for sym_type in range(256))
+
+
+def _sym_types_charset(sym_type_table):
+    return b''.join(re.escape(bytes([sym_type])) for sym_type in range(256) if sym_type_table[sym_type])
+
+
+# Symbol rows are validated by the re engine, valid symbol types are a char class built from the lookup table.
+# VxWorks 5.5 symbol: name point and value point should not be zero, group is '\x00\x00', type, '\x00'
+vx_5_symbol_end_regex = b'\x00\x00[' + _sym_types_charset(vx_5_sym_type_table) + b']\x00'
+vx_5_symbol_regex = b'.{4}(?!\x00{4}).{4}(?!\x00{4}).{4}' + vx_5_symbol_end_regex
+# symbol end starts with literal '\x00\x00', so re engine can skip to candidate symbols fast
+vx_5_symbol_end_pattern = re.compile(vx_5_symbol_end_regex)
+vx_5_symbol_table_pattern = re.compile(b'(?:%s){%d}' % (vx_5_symbol_regex, default_check_count), re.DOTALL)
+vx_5_symbols_pattern = re.compile(b'(?:%s)+' % vx_5_symbol_regex, re.DOTALL)
+
+# VxWorks 6.8 symbol: name point should not be zero, group is '\x00\x00', type, '\x00'
+# TODO: Need handle this problem, sometime symbol value point will be zero, so it is not checked
+vx_6_symbol_end_regex = b'\x00\x00[' + _sym_types_charset(vx_6_sym_type_table) + b']\x00'
+vx_6_symbol_regex = b'.{4}(?!\x00{4}).{12}' + vx_6_symbol_end_regex
+vx_6_symbol_end_pattern = re.compile(vx_6_symbol_end_regex)
+vx_6_symbol_table_pattern = re.compile(b'(?:%s){%d}' % (vx_6_symbol_regex, default_check_count), re.DOTALL)
+vx_6_symbols_pattern = re.compile(b'(?:%s)+' % vx_6_symbol_regex, re.DOTALL)
+
+non_zero_pattern = re.compile(b'[^\x00]')
+
+string_table_item_pattern = re.compile(b'[^\x00]*\x00+')
+
 
 class VxTarget(object):
     def __init__(self, firmware, vx_version=5, is_big_endian=False, logger=None):
@@ -66,16 +110,33 @@ class VxTarget(object):
         self._vx_version = vx_version
         self.symbol_table_start = None
         self.symbol_table_end = None
-        self._string_table = []
-        self._symbol_table = []
+        # symbol table and string table are stored as columns, sorted by symbol name point
+        self._symbol_name_addrs = array('L')
+        self._symbol_name_lengths = array('L')
+        self._symbol_dest_addrs = array('L')
+        self._symbol_flags = array('B')
+        self._symbol_offsets = array('L')
+        self._string_addresses = array('L')
+        self._string_lengths = array('L')
         self.symbols = []
         self.load_address = None
         self._firmware = firmware
+        # slices of memoryview don't copy firmware data
+        self._firmware_view = memoryview(firmware)
         self._has_symbol = None
         if self._vx_version == 5:
             self._symbol_interval = 16
+            self._symbol_format = vx_5_symbol_format
+            self._symbol_end_pattern = vx_5_symbol_end_pattern
+            self._symbol_table_pattern = vx_5_symbol_table_pattern
+            self._symbols_pattern = vx_5_symbols_pattern
         elif self._vx_version == 6:
             self._symbol_interval = 20
+            self._symbol_format = vx_6_symbol_format
+            self._symbol_end_pattern = vx_6_symbol_end_pattern
+            self._symbol_table_pattern = vx_6_symbol_table_pattern
+            self._symbols_pattern = vx_6_symbols_pattern
+        self._symbol_struct = None
         self.start_time = None
         self._performance_status = []
 
@@ -131,9 +192,9 @@ class VxTarget(object):
 
         :return:
         """
-        data1 = self._firmware[self.symbol_table_start + 4:self.symbol_table_start + 4 + self._symbol_interval]
-        data2 = self._firmware[self.symbol_table_start + 4 + self._symbol_interval:self.symbol_table_start +
-                                                                                   4 + self._symbol_interval * 2]
+        data1 = self._firmware_view[self.symbol_table_start + 4:self.symbol_table_start + 4 + self._symbol_interval]
+        data2 = self._firmware_view[self.symbol_table_start + 4 + self._symbol_interval:self.symbol_table_start +
+                                                                                        4 + self._symbol_interval * 2]
         if data1[0:2] == data2[0:2]:
             self.logger.info("VxWorks endian: Big endian.")
             self.is_big_endian = True
@@ -144,6 +205,11 @@ class VxTarget(object):
             self.logger.info("VxWorks endian unknown. Assuming little endian.")
             self.is_big_endian = False
 
+        if self.is_big_endian:
+            self._symbol_struct = struct.Struct('>' + self._symbol_format)
+        else:
+            self._symbol_struct = struct.Struct('<' + self._symbol_format)
+
     def _check_symbol_format(self, offset):
         """ Check offset is symbol table.
 
@@ -155,38 +221,25 @@ class VxTarget(object):
         if end_offset > len(self._firmware):
             return False
 
-        check_data = self._firmware[start_offset:end_offset]
-        is_big_endian = True
-        is_little_endian = True
         # check symbol data match struct
-        for i in range(default_check_count):
-            check_data_1 = check_data[i * self._symbol_interval:(i + 1) * self._symbol_interval]
-            if len(check_data_1) < self._symbol_interval:
-                self.logger.debug("check_data_1 length is too small: {}".format(len(check_data_1)))
-                break
+        if not self._symbol_table_pattern.match(self._firmware, start_offset):
+            return False
 
-            if self._check_symbol_format_simple(check_data_1) is False:
-                return False
+        check_data = self._firmware_view[start_offset:end_offset]
+        is_big_endian = True
+        is_little_endian = True
 
         if self._vx_version == 5:
             self.logger.debug("Check VxWorks 5 symbol format")
             # check is big endian
-            for i in range(9):
-                check_data_1 = check_data[4 + i * self._symbol_interval:6 + i * self._symbol_interval]
-                data2 = check_data[4 + (i + 1) * self._symbol_interval:6 + (i + 1) * self._symbol_interval]
-                if check_data_1 != data2:
-                    self.logger.debug("VxWorks binary is not big endian.")
-                    is_big_endian = False
-                    break
+            if not self._is_same_in_symbols(check_data, 4, 10):
+                self.logger.debug("VxWorks binary is not big endian.")
+                is_big_endian = False
 
             # check is little endian
-            for i in range(9):
-                check_data_1 = check_data[6 + i * self._symbol_interval:8 + i * self._symbol_interval]
-                data2 = check_data[6 + (i + 1) * self._symbol_interval:8 + (i + 1) * self._symbol_interval]
-                if check_data_1 != data2:
-                    self.logger.debug("VxWorks binary is not little endian.")
-                    is_little_endian = False
-                    break
+            if not self._is_same_in_symbols(check_data, 6, 10):
+                self.logger.debug("VxWorks binary is not little endian.")
+                is_little_endian = False
 
             if is_big_endian and is_little_endian:
                 return False
@@ -195,61 +248,17 @@ class VxTarget(object):
 
         return True
 
-    def _check_symbol_format_simple(self, data):
-        """ Check single symbol format is correct.
+    def _is_same_in_symbols(self, check_data, start, count):
+        """ Check 2 bytes from start of symbol are same in first count symbols.
 
-        :param data: single symbol data.
-        :return: True if data is symbol, False otherwise.
+        :param check_data: symbol table data.
+        :param start: start offset in symbol, should be even.
+        :param count: symbol count to check.
+        :return: True if bytes are same, False otherwise.
         """
-        if self._vx_version == 5:
-            # Check symbol type is valid
-            sym_type = data[14]
-            if sym_type not in vx_5_sym_types:
-                return False
-
-            # symbol should end with '\x00'
-            if data[15] != 0:
-                return False
-
-            # Check symbol group is '\x00\x00'
-            if data[12:14] != b'\x00\x00':
-                return False
-
-            # symbol_name point should not be zero
-            if data[4:8] == b'\x00\x00\x00\x00':
-                return False
-
-            # symbol value point should not be zero
-            if data[8:12] == b'\x00\x00\x00\x00':
-                return False
-
-            return True
-
-        elif self._vx_version == 6:
-            # Check symbol type is valid
-            sym_type = data[18]
-            if sym_type not in vx_6_sym_types:
-                return False
-
-            # symbol should end with '\x00'
-            if data[19] != 0:
-                return False
-
-            # Check symbol group is '\x00\x00'
-            if data[16:18] != b'\x00\x00':
-                return False
-
-            # symbol_name point should not be zero
-            if data[4:8] == b'\x00\x00\x00\x00':
-                return False
-
-            # TODO: Need handle this problem
-            # sometime data[8:12] will be '\x00\x00\x00\x00'
-            # if data[8:12] == '\x00\x00\x00\x00':
-            #     return False
-            return True
-
-        return False
+        # strided memoryview of the same half word in each symbol, compared in one call
+        data = check_data[:self._symbol_interval * count].cast('H')[start // 2::self._symbol_interval // 2]
+        return data[1:] == data[:-1]
 
     def find_symbol_table(self):
         """ Find symbol table from image.
@@ -257,40 +266,33 @@ class VxTarget(object):
         :return:
         """
         self.reset_timer()
-        for offset in range(len(self._firmware) - self._symbol_interval):
-            if self.symbol_table_start is None:
-                # Get first data valid the symbol_format
-                if not self._check_symbol_format_simple(self._firmware[offset: offset + self._symbol_interval]):
-                    continue
+        # group, type and '\x00' are the last 4 bytes of symbol
+        symbol_end_offset = self._symbol_interval - 4
+        search_offset = symbol_end_offset
+        while self.symbol_table_start is None:
+            # Get first data valid the symbol_format
+            match = self._symbol_end_pattern.search(self._firmware, search_offset)
+            if match is None:
+                break
 
-                elif self._check_symbol_format(offset):
-                    self.logger.info("symbol table start offset: {:010x}".format(offset))
-                    self.symbol_table_start = offset
-                    self._has_symbol = True
-                    self._firmware_info["has_symbol"] = True
-                    break
-            else:
+            offset = match.start() - symbol_end_offset
+            if self._check_symbol_format(offset):
+                self.logger.info("symbol table start offset: {:010x}".format(offset))
+                self.symbol_table_start = offset
+                self._has_symbol = True
+                self._firmware_info["has_symbol"] = True
                 break
+            search_offset = match.start() + 1
         performance_data = "Find symbol table takes {:.3f} seconds".format(self.get_timer())
         self._performance_status.append(performance_data)
         self.logger.debug(performance_data)
 
         if self.symbol_table_start:
             self.reset_timer()
-            for i in range(self.symbol_table_start, len(self._firmware), self._symbol_interval):
-                check_data = self._firmware[i:i + self._symbol_interval]
-
-                if len(check_data) < self._symbol_interval:
-                    self.logger.debug("check_data length is too small: {}".format(check_data))
-                    break
-
-                if self._check_symbol_format_simple(check_data):
-                    self.symbol_table_end = i + self._symbol_interval
-                    self.logger.debug("self.symbol_table_end: {:010x}".format(self.symbol_table_end))
-
-                else:
-                    self.logger.info("Symbol table end offset: {:010x}".format(self.symbol_table_end))
-                    break
+            # symbol table end at the first data doesn't valid the symbol_format
+            match = self._symbols_pattern.match(self._firmware, self.symbol_table_start)
+            self.symbol_table_end = match.end()
+            self.logger.info("Symbol table end offset: {:010x}".format(self.symbol_table_end))
 
         else:
             self.logger.error("Didn't find symbol table in this image")
@@ -311,24 +313,21 @@ class VxTarget(object):
         else:
             return False
 
-        for i in range(self.symbol_table_start, self.symbol_table_end, self._symbol_interval):
-            symbol_name_addr = self._firmware[i + 4:i + 8]
-            symbol_dest_addr = self._firmware[i + 8:i + 12]
-            symbol_flag = self._firmware[i + self._symbol_interval - 2]
-            if self.is_big_endian:
-                unpack_format = '>I'
-            else:
-                unpack_format = '<I'
-            symbol_name_addr = int(struct.unpack(unpack_format, symbol_name_addr)[0])
-            symbol_dest_addr = int(struct.unpack(unpack_format, symbol_dest_addr)[0])
-            self.logger.debug("symbol_name_addr: {}; symbol_dest_addr: {}".format(symbol_name_addr, symbol_dest_addr))
-            self._symbol_table.append({'symbol_name_addr': symbol_name_addr, 'symbol_name_length': None, 'symbol_dest_addr': symbol_dest_addr, 'symbol_flag': symbol_flag, 'offset': i})
-        self.logger.debug("len(self._symbol_table): %s".format(len(self._symbol_table)))
-        self._symbol_table = sorted(self._symbol_table, key=lambda x: x['symbol_name_addr'])
-        for i in range(len(self._symbol_table) - 1):
-            self._symbol_table[i]['symbol_name_length'] = self._symbol_table[i + 1]['symbol_name_addr'] - \
-                                                        self._symbol_table[i]['symbol_name_addr']
-        self.logger.debug("len(self._symbol_table): %s".format(len(self._symbol_table)))
+        symbol_table_data = self._firmware_view[self.symbol_table_start:self.symbol_table_end]
+        symbol_offsets = range(self.symbol_table_start, self.symbol_table_end, self._symbol_interval)
+        symbol_entries = self._symbol_struct.iter_unpack(symbol_table_data)
+        symbols = [symbol + (offset, ) for symbol, offset in zip(symbol_entries, symbol_offsets)]
+        self.logger.debug("len(symbols): {}".format(len(symbols)))
+        symbols.sort(key=itemgetter(0))
+        symbol_name_addrs, symbol_dest_addrs, symbol_flags, symbol_offsets = zip(*symbols)
+        self._symbol_name_addrs = array('L', symbol_name_addrs)
+        self._symbol_dest_addrs = array('L', symbol_dest_addrs)
+        self._symbol_flags = array('B', symbol_flags)
+        self._symbol_offsets = array('L', symbol_offsets)
+        # symbol name length is the distance to next symbol name, last symbol name length is unknown
+        self._symbol_name_lengths = array('L', map(sub, symbol_name_addrs[1:], symbol_name_addrs[:-1]))
+        self._symbol_name_lengths.append(0)
+        self.logger.debug("len(self._symbol_name_addrs): {}".format(len(self._symbol_name_addrs)))
         return True
 
     @staticmethod
@@ -370,20 +369,15 @@ class VxTarget(object):
         :param offset: offset of image.
         :return: string data, string start offset, string end offset.
         """
-        while offset > 0:
-            if self._firmware[offset] != 0:
-                start_address = offset
-                end_address = offset + 1
-                while offset > 0:
-                    if self._firmware[offset - 1] == 0:
-                        start_address = offset
-                        break
-                    offset -= 1
-                data = self._firmware[start_address:end_address]
-                self.logger.debug("data: {}; start_address: {:010x}; end_address: {:010x}".format(data, start_address, end_address))
-                return data, start_address, end_address
-            else:
-                offset -= 1
+        while offset > 0 and self._firmware[offset] == 0:
+            offset -= 1
+
+        if offset > 0:
+            start_address = self._firmware.rfind(b'\x00', 0, offset) + 1
+            end_address = offset + 1
+            data = self._firmware[start_address:end_address]
+            self.logger.debug("data: {}; start_address: {:010x}; end_address: {:010x}".format(data, start_address, end_address))
+            return data, start_address, end_address
         self.logger.debug("Done looking for previous string data.")
         return None, None, None
 
@@ -393,19 +387,14 @@ class VxTarget(object):
         :param offset: offset of image.
         :return: string data, string start offset, string end offset.
         """
-        while offset < len(self._firmware):
-            if self._firmware[offset] != 0:
-                start_address = offset
-                end_address = offset
-                while offset <= len(self._firmware):
-                    offset += 1
-                    if self._firmware[offset] == 0:
-                        end_address = offset
-                        break
-                data = self._firmware[start_address:end_address]
-                return data, start_address, end_address
-            else:
-                offset += 1
+        match = non_zero_pattern.search(self._firmware, offset)
+        if match:
+            start_address = match.start()
+            end_address = self._firmware.find(b'\x00', start_address)
+            if end_address == -1:
+                end_address = len(self._firmware)
+            data = self._firmware[start_address:end_address]
+            return data, start_address, end_address
         return None, None, None
 
     def find_string_table_by_key_function_index(self, key_offset):
@@ -416,19 +405,21 @@ class VxTarget(object):
         """
         self.logger.debug("Attempting to find string table by key function index with offset {:010x}".format(key_offset))
         temp_str_tab_data = []
-        if len(self._symbol_table) > default_check_count:
+        if len(self._symbol_name_addrs) > default_check_count:
             count = default_check_count
         else:
-            count = len(self._symbol_table)
+            count = len(self._symbol_name_addrs)
         start_offset = key_offset
         end_offset = key_offset
         self.logger.debug("Initializing with start_offset = end_offset = {:010x}".format(key_offset))
+        log_debug = self.logger.isEnabledFor(logging.DEBUG)
 
         while start_offset > 0:
             if self._is_printable(self._firmware[start_offset]) is True:
                 # get string from offset
                 string, start_address, end_address = self._get_prev_string_data(start_offset)
-                self.logger.debug("string: {}; start_address: {:010x}; end_address: {:010x}".format(string, start_address, end_address))
+                if log_debug:
+                    self.logger.debug("string: %s; start_address: %010x; end_address: %010x", string, start_address, end_address)
                 # check string is function name
                 if self._is_func_name(string) is False:
                     if len(temp_str_tab_data) < count:
@@ -442,8 +433,10 @@ class VxTarget(object):
 
                 # get previous string from offset
                 prev_string, prev_start_address, prev_end_address = self._get_prev_string_data(start_address - 1)
-                self.logger.debug("prev_string: {}, prev_start_address: {:010x}, prev_end_address: {:010x}".format(prev_string, prev_start_address, prev_end_address))
                 if prev_start_address:
+                    if log_debug:
+                        self.logger.debug("prev_string: %s, prev_start_address: %010x, prev_end_address: %010x",
+                                          prev_string, prev_start_address, prev_end_address)
                     # strings interval should less than 4
                     if 4 < (start_address - prev_end_address):
                         if len(temp_str_tab_data) < count:
@@ -454,7 +447,8 @@ class VxTarget(object):
                             break
                     else:
                         start_offset = start_address - 1
-                        self.logger.debug("start_offset: {}".format(start_offset))
+                        if log_debug:
+                            self.logger.debug("start_offset: %s", start_offset)
                 else:
                     break
             else:
@@ -507,25 +501,15 @@ class VxTarget(object):
         :param str_end_address: string table end address.
         :return:
         """
-        self._string_table = []
-        offset = str_start_address
-        address = offset
-        str_tab_data = []
-        while offset <= str_end_address:
-            if self._firmware[offset] == 0:
-                while offset <= str_end_address:
-                    offset += 1
-                    if self._firmware[offset] != 0:
-                        next_address = offset
-                        string = self._firmware[address:next_address]
-                        length = next_address - address
-                        str_tab_data.append({'address': address, 'string': string, 'length': length})
-                        offset = next_address
-                        address = next_address
-                        break
-            else:
-                offset += 1
-        self._string_table = str_tab_data
+        self._string_addresses = array('L')
+        self._string_lengths = array('L')
+        # every string table item is a string with '\x00' padding, and should followed by next string
+        for match in string_table_item_pattern.finditer(self._firmware, str_start_address, str_end_address + 2):
+            address, next_address = match.span()
+            if next_address > str_end_address + 1 or next_address >= len(self._firmware):
+                break
+            self._string_addresses.append(address)
+            self._string_lengths.append(next_address - address)
 
     def _check_fix(self, func_index, str_index):
         """
@@ -536,37 +520,48 @@ class VxTarget(object):
         """
         try:
             fault_count = 0
-            self.logger.debug("Symbol table's first element: {}".format(self._symbol_table[0]))
-            if len(self._symbol_table) <= default_check_count:
-                count = len(self._symbol_table)
-                self.logger.debug("Length of symbol table, {}, is less than default. Setting iteration count to actual length of table, {}.".format(len(self._symbol_table), count))
+            symbol_name_lengths = self._symbol_name_lengths
+            string_lengths = self._string_lengths
+            symbol_count = len(symbol_name_lengths)
+            string_count = len(string_lengths)
+            log_debug = self.logger.isEnabledFor(logging.DEBUG)
+            if log_debug:
+                self.logger.debug("Symbol table's first symbol name point: %s", self._symbol_name_addrs[0])
+            if symbol_count <= default_check_count:
+                count = symbol_count
+                if log_debug:
+                    self.logger.debug("Length of symbol table, %s, is less than default. Setting iteration count to actual length of table, %s.", symbol_count, count)
             else:
                 count = default_check_count
-                self.logger.debug("Length of symbol table, {}, is greater than default. Setting iteration count to default, {}.".format(len(self._symbol_table), count))
+                if log_debug:
+                    self.logger.debug("Length of symbol table, %s, is greater than default. Setting iteration count to default, %s.", symbol_count, count)
             for i in range(count):
 
-                if (func_index >= len(self._symbol_table)) or (str_index >= len(self._string_table)):
-                    self.logger.debug("_check_fix False: func_index greater than length of _symbol_table, or str_index greater than length of _string_table.")
+                if (func_index >= symbol_count) or (str_index >= string_count):
+                    self.logger.debug("_check_fix False: func_index greater than length of symbol table, or str_index greater than length of string table.")
                     return False
-                self.logger.debug("str_index: {}; _string_table[str_index]: {}".format(str_index, self._string_table[str_index]))
-                self.logger.debug("func_index: {}; _symbol_table[func_index]: {}".format(func_index, self._symbol_table[func_index]))
+                string_length = string_lengths[str_index]
+                symbol_name_length = symbol_name_lengths[func_index]
+                if log_debug:
+                    self.logger.debug("str_index: %s; _string_lengths[str_index]: %s", str_index, string_length)
+                    self.logger.debug("func_index: %s; _symbol_name_lengths[func_index]: %s", func_index, symbol_name_length)
                 if i == count - 1:
-                    if fault_count < 10:
-                        self.logger.debug("_check_fix True")
-                        return True
-                    else:
-                        self.logger.debug("_check_fix False: Too many faults.")
-                        return False
+                    self.logger.debug("_check_fix True")
+                    return True
 
-                if self._string_table[str_index]['length'] == self._symbol_table[func_index]['symbol_name_length']:
+                if string_length == symbol_name_length:
                     func_index += 1
                     str_index += 1
                     self.logger.debug("_check_fix continue")
 
-                elif self._symbol_table[func_index]['symbol_name_length'] < self._string_table[str_index]['length']:
+                elif symbol_name_length < string_length:
                     # Sometime Symbol name might point to mid of string.
                     fault_count += 1
                     func_index += 1
+                    # fault count never decrease, stop checking once too many faults.
+                    if fault_count >= 10:
+                        self.logger.debug("_check_fix False: Too many faults.")
+                        return False
                 else:
                     self.logger.debug("_check_fix False: symbol_name_length from func_index larger than length from str_index.")
                     return False
@@ -585,12 +580,20 @@ class VxTarget(object):
         if self._has_symbol is False:
             return None
 
+        key_function_index = -1
         for key_word in function_name_key_words:
-            prefix_keyword = b'\x00_' + key_word + b'\x00'
-            key_word = b'\x00' + key_word + b'\x00'
-            if key_word in self._firmware is False and prefix_keyword in self._firmware is False:
-                self.logger.info("Firmware does not contain a function named {}".format(key_word))
-                return None
+            # Handler _ prefix symbols
+            for function_name in (b'\x00' + key_word + b'\x00', b'\x00_' + key_word + b'\x00'):
+                key_function_index = self._firmware.find(function_name)
+                if key_function_index != -1:
+                    break
+            if key_function_index != -1:
+                break
+            self.logger.info("Firmware does not contain a function named {}".format(key_word))
+
+        if key_function_index == -1:
+            return None
+        self.logger.debug("key_function_index: {}".format(key_function_index))
 
         performance_data = "Search function keyword in firmware takes {:.3f} seconds".format(self.get_timer())
         self._performance_status.append(performance_data)
@@ -598,43 +601,35 @@ class VxTarget(object):
 
         # Search function keyword in firmware to locate the function string tables.
         self.reset_timer()
-        try:
-            key_function_index = self._firmware.index(b'\x00' + function_name_key_words[0] + b'\x00')
-            self.logger.debug("key_function_index: {}".format(key_function_index))
-        except Exception as err:
-            # Handler _ prefix symbols
-            self.logger.debug("Exception occurred while loading key_function_index: {}. Continuing...".format(err))
-            key_function_index = self._firmware.index(b'\x00_' + function_name_key_words[0] + b'\x00')
-            self.logger.debug("key_function_index: {}".format(key_function_index))
-
         str_start_address, str_end_address = self.find_string_table_by_key_function_index(key_function_index)
         self.get_string_table(str_start_address, str_end_address)
         performance_data = "Get function string table takes {:.3f} seconds".format(self.get_timer())
         self._performance_status.append(performance_data)
         self.logger.debug(performance_data)
 
-        # TODO: Need improve performance
         self.reset_timer()
         self.logger.info("Starting loading address analysis")
-        for str_index in range(len(self._string_table)):
-            for func_index in range(len(self._symbol_table)):
-                self.logger.debug("self._string_table[str_index]['length']: {}".format(self._string_table[str_index]['length']))
-                self.logger.debug("self._symbol_table[func_index]['symbol_name_length']: {}".format(self._symbol_table[func_index]['symbol_name_length']))
-                if self._string_table[str_index]['length'] == self._symbol_table[func_index]['symbol_name_length']:
-                    if self._check_fix(func_index, str_index) is True:
-                        self.logger.debug("self._symbol_table[func_index]['symbol_name_addr']: {}".format(self._symbol_table[func_index]['symbol_name_addr']))
-                        self.logger.debug("self._string_table[str_index]['address']: %s" % self._string_table[str_index]['address'])
-                        self.load_address = self._symbol_table[func_index]['symbol_name_addr'] - \
-                                            self._string_table[str_index]['address']
-                        self._firmware_info["load_address"] = self.load_address
-                        self.logger.info('load address is {:010x}'.format(self.load_address))
-                        performance_data = "Analyze loading address takes {:.3f} seconds".format(
-                            self.get_timer())
-                        self._performance_status.append(performance_data)
-                        self.logger.debug(performance_data)
-                        return self.load_address
-                else:
-                    continue
+        # Only symbols whose name length equal to the string length can match, group symbols by length.
+        symbol_indexes_by_length = defaultdict(list)
+        for func_index, symbol_name_length in enumerate(self._symbol_name_lengths):
+            symbol_indexes_by_length[symbol_name_length].append(func_index)
+
+        log_debug = self.logger.isEnabledFor(logging.DEBUG)
+        for str_index, string_length in enumerate(self._string_lengths):
+            if log_debug:
+                self.logger.debug("self._string_lengths[str_index]: %s", string_length)
+            for func_index in symbol_indexes_by_length.get(string_length, []):
+                if self._check_fix(func_index, str_index) is True:
+                    self.logger.debug("self._symbol_name_addrs[func_index]: {}".format(self._symbol_name_addrs[func_index]))
+                    self.logger.debug("self._string_addresses[str_index]: %s" % self._string_addresses[str_index])
+                    self.load_address = self._symbol_name_addrs[func_index] - self._string_addresses[str_index]
+                    self._firmware_info["load_address"] = self.load_address
+                    self.logger.info('load address is {:010x}'.format(self.load_address))
+                    performance_data = "Analyze loading address takes {:.3f} seconds".format(
+                        self.get_timer())
+                    self._performance_status.append(performance_data)
+                    self.logger.debug(performance_data)
+                    return self.load_address
 
         self.logger.error("We didn't find load address in this firmware, sorry!")
         performance_data = "Analyze loading address takes {:.3f} seconds".format(self.get_timer())
@@ -649,14 +644,14 @@ class VxTarget(object):
         """
         if not self._has_symbol:
             return False
-        if len(self._symbol_table) > default_check_count:
+        if len(self._symbol_name_addrs) > default_check_count:
             self.logger.debug("Length of symbol table greater than default. Setting iteration count to default of {}.".format(default_check_count))
             count = default_check_count
         else:
-            count = len(self._symbol_table)
+            count = len(self._symbol_name_addrs)
         self.logger.debug("symbol_table length is {}".format(count))
         for i in range(count):
-            offset = self._symbol_table[i]['symbol_name_addr'] - address
+            offset = self._symbol_name_addrs[i] - address
             if offset <= 0:
                 return False
             # TODO: Need improve, currently use string point to check.
@@ -691,38 +686,59 @@ class VxTarget(object):
         self.is_big_endian = False
         self.symbol_table_start = None
         self.symbol_table_end = None
-        self._string_table = []
-        self._symbol_table = []
+        self._symbol_name_addrs = array('L')
+        self._symbol_name_lengths = array('L')
+        self._symbol_dest_addrs = array('L')
+        self._symbol_flags = array('B')
+        self._symbol_offsets = array('L')
+        self._string_addresses = array('L')
+        self._string_lengths = array('L')
         self.load_address = None
         self._has_symbol = None
 
+    def _get_string_end(self, string_offset):
+        # mmap has no index(), find terminator with find()
+        string_end = self._firmware.find(b'\x00', string_offset)
+        if string_end == -1:
+            raise IndexError("string at offset {} has no terminator".format(string_offset))
+        return string_end
+
     def get_string_from_firmware_by_offset(self, string_offset):
-        symbol_name = ""
-        while True:
-            if self._firmware[string_offset] != 0x00:
-                symbol_name += chr(self._firmware[string_offset])
-                string_offset += 1
+        # keep raw bytes, symbol names are written to r2 script without decoding
+        return self._firmware[string_offset:self._get_string_end(string_offset)]
 
-            else:
-                break
+    def get_strings_from_firmware_by_offsets(self, string_offsets):
+        """ Get strings from firmware by ascending offsets.
 
-        return symbol_name
+        :param string_offsets: ascending string offsets.
+        :return: list of strings.
+        """
+        firmware = self._firmware
+        strings = []
+        string_end = -1
+        for string_offset in string_offsets:
+            # offset not after previous terminator is in the same string, which ends at the same terminator
+            if not 0 <= string_offset <= string_end:
+                string_end = self._get_string_end(string_offset)
+            strings.append(firmware[string_offset:string_end])
+        return strings
 
     def get_symbols(self):
         self.symbols = []
         if self.load_address:
-            for symbol in self._symbol_table:
-                symbol_name_addr = symbol["symbol_name_addr"]
-                symbol_dest_addr = symbol["symbol_dest_addr"]
-                symbol_flag = symbol["symbol_flag"]
-                symbol_name_firmware_addr = symbol_name_addr - self.load_address
-                symbol_name = self.get_string_from_firmware_by_offset(symbol_name_firmware_addr)
-                self.symbols.append({
-                    "symbol_name": symbol_name,
-                    "symbol_name_addr": symbol_name_addr,
-                    "symbol_dest_addr": symbol_dest_addr,
-                    "symbol_flag": symbol_flag
-                })
+            load_address = self.load_address
+            # symbol table is sorted by symbol name point, so name offsets are ascending
+            symbol_names = self.get_strings_from_firmware_by_offsets(
+                symbol_name_addr - load_address for symbol_name_addr in self._symbol_name_addrs)
+            self.symbols = [{
+                "symbol_name": symbol_name,
+                "symbol_name_addr": symbol_name_addr,
+                "symbol_dest_addr": symbol_dest_addr,
+                "symbol_flag": symbol_flag
+            } for symbol_name, symbol_name_addr, symbol_dest_addr, symbol_flag in zip(symbol_names,
+                                                                                      self._symbol_name_addrs,
+                                                                                      self._symbol_dest_addrs,
+                                                                                      self._symbol_flags)]
             return self.symbols
 
         else:
@@ -737,6 +753,24 @@ class VxTarget(object):
         return self._performance_status
 
 
+def _find_open_parenthesis(demangle_string, close_index):
+    """ Find the '(' matching the ')' at close_index, -1 if not found. """
+    depth = 1
+    open_index = demangle_string.rfind('(', 0, close_index)
+    next_close_index = demangle_string.rfind(')', 0, close_index)
+    while open_index != -1:
+        if next_close_index > open_index:
+            # nested parentheses
+            depth += 1
+            next_close_index = demangle_string.rfind(')', 0, next_close_index)
+        else:
+            depth -= 1
+            if depth == 0:
+                return open_index
+            open_index = demangle_string.rfind('(', 0, open_index)
+    return -1
+
+
 def demangle_function(demangle_string):
     function_return = None
     function_parameters = None
@@ -746,29 +780,12 @@ def demangle_function(demangle_string):
     index = len(demangle_string) - 1
     if demangle_string[-1] == ')':
         # have parameters
-        parentheses_count = 0
-        while index >= 0:
-            if demangle_string[index] == ')':
-                parentheses_count += 1
-
-            elif demangle_string[index] == '(':
-                parentheses_count -= 1
-
-            index -= 1
-
-            if parentheses_count == 0:
-                break
-
+        index = max(_find_open_parenthesis(demangle_string, index) - 1, -1)
         function_parameters = demangle_string[index + 2:-1]
         function_name_end = index
 
     # get function name
-    while index >= 0:
-        if demangle_string[index] == ' ':
-            break
-        else:
-            index -= 1
-    function_name_start = index
+    function_name_start = demangle_string.rfind(' ', 0, index + 1)
     function_name = demangle_string[function_name_start + 1:function_name_end + 1]
 
     # get function return
@@ -780,7 +797,8 @@ def autodetect_vxworks_version(r2p):
     ''' Naive way to autodetect VxWorks version '''
     vx_version = None
     # TODO: replace with cmdj and izzj later, currently izzj is not stable.
-    vx_version_r2p = r2p.cmd("izz~VxWorks")
+    # only strings naming a version go through the pipe, r2 grep with "," matches any of the words
+    vx_version_r2p = r2p.cmd("izz~VxWorks5,VxWorks6")
     if 'VxWorks5' in vx_version_r2p:
         vx_version = 5
 
@@ -808,30 +826,48 @@ def manual_vxworks_version():
             return None
 
 
-def add_symbol(symbol_name, symbol_name_address, symbol_address, symbol_type):
-    # Load symbols
-    if symbol_name:
-        if symbol_type in need_create_function:
-            r2_command = "fs functions; f {} @ 0x{:08X}".format(symbol_name, symbol_address)
-            r2p.cmd(r2_command)
-            # TODO: Need find a way to disable warnning "af: Cannot find function at"
-            r2_command = "af {} 0x{:08X}".format(symbol_name, symbol_address)
-            r2p.cmd(r2_command)
+def queue_r2_command(r2_command):
+    # every r2p.cmd is a pipe round trip, queued commands are run together as a r2 script
+    pending_r2_commands.append(r2_command)
 
-        else:
-            r2_command = "fs symbols; f {} @ 0x{:08X}".format(symbol_name, symbol_address)
-            r2p.cmd(r2_command)
+
+def flush_r2_commands():
+    # flags and functions only exist in the r2 session creating them, so the script is run in this
+    # session rather than split over extra r2 instances which would have to be replayed here anyway
+    if not pending_r2_commands:
+        return
+    script_file = tempfile.NamedTemporaryFile('wb', suffix='.r2', delete=False)
+    try:
+        with script_file:
+            script_file.write(b"\n".join(pending_r2_commands))
+            script_file.write(b"\n")
+        r2p.cmd(". {}".format(script_file.name))
+    finally:
+        os.remove(script_file.name)
+    del pending_r2_commands[:]
+
+
+def add_symbol(symbol_name, symbol_name_address, symbol_address, symbol_type):
+    # Load symbols, symbol_name should not be empty and flag space of the symbol type should be selected before
+    if symbol_type in need_create_function:
+        r2_command = b"f %b @ 0x%08X" % (symbol_name, symbol_address)
+        queue_r2_command(r2_command)
+        # TODO: Need find a way to disable warnning "af: Cannot find function at"
+        r2_command = b"af %b 0x%08X" % (symbol_name, symbol_address)
+        queue_r2_command(r2_command)
+
+    else:
+        r2_command = b"f %b @ 0x%08X" % (symbol_name, symbol_address)
+        queue_r2_command(r2_command)
 
     return
 
 
 def get_r2_opened_file(r2_opened_file_data):
-    for opened_file in r2_opened_file_data:
-        if isinstance(opened_file, dict):
-            if opened_file["raised"] is True and not opened_file["uri"].lower().startswith("malloc"):
-                return opened_file["uri"]
-
-    return None
+    # only lower the uri prefix, uri of firmware might be long
+    return next((opened_file["uri"] for opened_file in r2_opened_file_data
+                 if isinstance(opened_file, dict) and opened_file["raised"] is True and
+                 opened_file["uri"][:6].lower() != "malloc"), None)
 
 
 if __name__ == '__main__':
@@ -865,7 +901,9 @@ if __name__ == '__main__':
         sys.exit()
     print("firmware_path: {}".format(firmware_path))
 
-    firmware = open(firmware_path, 'rb').read()
+    # map firmware instead of reading a copy, pages are loaded when the analyzer touches them
+    with open(firmware_path, 'rb') as firmware_file:
+        firmware = mmap.mmap(firmware_file.fileno(), 0, access=mmap.ACCESS_READ)
     target = VxTarget(firmware=firmware, vx_version=vx_version)
     # target.logger.setLevel(logging.DEBUG)
     print("\n###### Start analyze firmware ######")
@@ -882,6 +920,11 @@ if __name__ == '__main__':
     print("Found VxWorks image load address: 0x{:08X}".format(image_load_address))
     print("Found VxWorks symbol table from 0x{:08X} to 0x{:08X}".format(symbol_table_start_address,
                                                                         symbol_table_end_address))
+    symbols = target.get_symbols()
+    is_big_endian = target.is_big_endian
+    # symbols are copied out of firmware, release the mapping before r2 opens the file again
+    del target
+    firmware.close()
 
 
     ##################
@@ -907,29 +950,31 @@ if __name__ == '__main__':
 
     # Check endian
     print("\n###### Start analyzing functions######")
-    if target.is_big_endian:
+    if is_big_endian:
         r2p.cmd("e cfg.bigendian=True")
 
-    symbols = target.get_symbols()
-    for symbol in symbols:
-        try:
-            symbol_name = symbol["symbol_name"]
-            symbol_name_addr = symbol["symbol_name_addr"]
-            symbol_dest_addr = symbol["symbol_dest_addr"]
-            symbol_type = symbol["symbol_flag"]
-            add_symbol(symbol_name, symbol_name_addr, symbol_dest_addr, symbol_type)
-
-        except Exception as err:
-            continue
-
-    flags = r2p.cmdj("fsj")
-    function_count = 0
-    symbol_count = 0
-    for flag in flags:
-        if flag['name'] == "functions":
-            function_count = flag["count"]
-        elif flag['name'] == "symbols":
-            symbol_count = flag["count"]
+    # group symbols by flag space, so each flag space is selected only once
+    function_symbols = [symbol for symbol in symbols if symbol["symbol_flag"] in need_create_function]
+    other_symbols = [symbol for symbol in symbols if symbol["symbol_flag"] not in need_create_function]
+    try:
+        for flag_space, flag_space_symbols in ((b"functions", function_symbols), (b"symbols", other_symbols)):
+            queue_r2_command(b"fs " + flag_space)
+            for symbol in flag_space_symbols:
+                # skip symbols without name
+                if not symbol["symbol_name"]:
+                    continue
+                add_symbol(symbol["symbol_name"], symbol["symbol_name_addr"], symbol["symbol_dest_addr"],
+                           symbol["symbol_flag"])
+        flush_r2_commands()
+
+    except Exception as err:
+        print("Failed to load symbols: {}".format(err))
+
+    # let r2 count the flags of each flag space, instead of parsing all flag spaces
+    flag_counts = {flag_space: int(r2p.cmd("fs {}; f~?".format(flag_space)).strip() or 0)
+                   for flag_space in ("functions", "symbols")}
+    function_count = flag_counts["functions"]
+    symbol_count = flag_counts["symbols"]
 
     r2_command = "?E3 Finished, VxHunter found {} functions and {} symbols ^_^".format(function_count, symbol_count)
     print("\n{}".format(r2p.cmd(r2_command)))